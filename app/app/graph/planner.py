@@ -3,15 +3,22 @@ from langgraph.graph import StateGraph, END
 from langchain.schema import BaseMessage
 from typing import List, Dict, Any, AsyncGenerator, Optional
 import asyncio
-import json
+import time
+import numpy as np
+import orjson
+from contextvars import ContextVar
 from dataclasses import dataclass, field
 from app.sandbox.run import SandboxRunner
 from app.utils.scoring import PatchScorer
 
+# Per-plan sink for streamed LLM tokens; kept off PlanningState so the state stays serializable
+_token_sink: ContextVar[Optional[asyncio.Queue]] = ContextVar("token_sink", default=None)
+
 @dataclass
 class PlanningState:
     query: str
     context: Dict[str, Any] = field(default_factory=dict)
+    context_json: str = ""  # Serialized once per plan for prompt building
     branches: List[Dict[str, Any]] = field(default_factory=list)
     selected_patch: Optional[Dict[str, Any]] = None
     execution_result: Optional[Dict[str, Any]] = None
@@ -31,28 +38,35 @@ class TreeOfThoughtPlanner:
         workflow = StateGraph(PlanningState)
         
         # NOVEL: Multi-branch generation with critique loop
-        workflow.add_node("generate_branches", self._generate_branches)
-        workflow.add_node("critique_branches", self._critique_branches)
+        workflow.add_node("generate_and_critique", self._generate_and_critique)
         workflow.add_node("rank_branches", self._rank_branches)
         workflow.add_node("execute_patch", self._execute_patch)
         workflow.add_node("validate_result", self._validate_result)
         
         # Define the flow
-        workflow.set_entry_point("generate_branches")
-        workflow.add_edge("generate_branches", "critique_branches")
-        workflow.add_edge("critique_branches", "rank_branches")
-        workflow.add_edge("rank_branches", "execute_patch")
-        workflow.add_edge("execute_patch", "validate_result")
+        workflow.set_entry_point("generate_and_critique")
+        workflow.add_edge("generate_and_critique", "rank_branches")
+        # Skip sandbox execution / validation when there is nothing to act on
+        workflow.add_conditional_edges(
+            "rank_branches",
+            lambda s: "execute" if s.selected_patch else "end",
+            {"execute": "execute_patch", "end": END}
+        )
+        workflow.add_conditional_edges(
+            "execute_patch",
+            lambda s: "validate" if s.execution_result and s.execution_result.get("success") else "end",
+            {"validate": "validate_result", "end": END}
+        )
         workflow.add_edge("validate_result", END)
         
         return workflow.compile()
     
-    async def _generate_branches(self, state: PlanningState) -> PlanningState:
-        """Generate multiple solution branches for the given problem"""
+    async def _generate_and_critique(self, state: PlanningState) -> PlanningState:
+        """Generate solution branches with their critiques in a single LLM call"""
         
         prompt = f"""
         Problem: {state.query}
-        Context: {json.dumps(state.context, indent=2)}
+        Context: {state.context_json}
         
         Generate 3-5 different approaches to solve this problem.
         For each approach, provide:
@@ -60,83 +74,86 @@ class TreeOfThoughtPlanner:
         2. Potential risks
         3. Implementation steps
         4. Expected outcome
+        5. critique: {{feasibility (1-10), safety_score (1-10), issues, suggestions}}
         
-        Format as JSON array of objects.
+        Return a JSON object of the form {{"branches": [...]}}.
         """
         
-        # NOVEL: Parallel branch generation for efficiency
-        response = await self.llm_provider.generate_async(prompt)
-        branches = json.loads(response)
+        # NOVEL: One round trip for generation + critique instead of 1 + N
+        token_sink = _token_sink.get()
+        chunks = []
+        async for token in self.llm_provider.generate_stream_async(
+            prompt,
+            response_format={"type": "json_object"}
+        ):
+            chunks.append(token)
+            if token_sink is not None:
+                token_sink.put_nowait({
+                    "type": "token",
+                    "content": token,
+                    "timestamp": time.monotonic()
+                })
+        response = "".join(chunks)
+        branches = orjson.loads(response).get("branches", [])
+        
+        for branch in branches:
+            critique = branch.get("critique")
+            if not isinstance(critique, dict) or not {"feasibility", "safety_score"} <= critique.keys():
+                branch["critique"] = self._fallback_critique("missing or incomplete critique")
         
         state.branches = branches
         state.reasoning_tree.append({
             "step": "branch_generation",
             "branches_count": len(branches),
-            "timestamp": asyncio.get_event_loop().time()
+            "critiques_generated": len(branches),
+            "timestamp": time.monotonic()
         })
         
         return state
     
-    async def _critique_branches(self, state: PlanningState) -> PlanningState:
-        """Critique each branch for feasibility and safety"""
-        
-        critiqued_branches = []
-        
-        for i, branch in enumerate(state.branches):
-            critique_prompt = f"""
-            Analyze this solution approach:
-            {json.dumps(branch, indent=2)}
-            
-            Provide critique on:
-            1. Feasibility (1-10)
-            2. Safety score (1-10)
-            3. Potential issues
-            4. Improvement suggestions
-            
-            Return JSON format.
-            """
-            
-            critique = await self.llm_provider.generate_async(critique_prompt)
-            branch["critique"] = json.loads(critique)
-            critiqued_branches.append(branch)
-        
-        state.branches = critiqued_branches
-        state.reasoning_tree.append({
-            "step": "branch_critique",
-            "critiques_generated": len(critiqued_branches),
-            "timestamp": asyncio.get_event_loop().time()
-        })
-        
-        return state
+    def _fallback_critique(self, reason: str) -> Dict[str, Any]:
+        """Low-confidence critique used when the model omits or mangles one"""
+        return {
+            "feasibility": 1,
+            "safety_score": 1,
+            "issues": [f"Critique unavailable: {reason}"],
+            "suggestions": []
+        }
     
     async def _rank_branches(self, state: PlanningState) -> PlanningState:
         """Rank branches using composite scoring algorithm"""
         
+        # Nothing to rank (common when the model returns malformed JSON)
+        if not state.branches:
+            state.selected_patch = None
+            state.reasoning_tree.append({
+                "step": "branch_ranking",
+                "top_score": 0,
+                "selected_branch": state.selected_patch,
+                "timestamp": time.monotonic()
+            })
+            return state
+        
         # NOVEL: Multi-factor scoring: feasibility × safety × performance potential
-        scored_branches = []
-        
-        for branch in state.branches:
-            score = self.patch_scorer.calculate_composite_score(
-                feasibility=branch["critique"]["feasibility"],
-                safety=branch["critique"]["safety_score"],
-                complexity=len(branch.get("implementation_steps", [])),
-                context=state.context
-            )
-            
-            branch["composite_score"] = score
-            scored_branches.append(branch)
+        branches = state.branches
+        scores = self.patch_scorer.calculate_composite_scores_batch(
+            feasibility=np.array([b["critique"]["feasibility"] for b in branches], dtype=float),
+            safety=np.array([b["critique"]["safety_score"] for b in branches], dtype=float),
+            complexity=np.array([len(b.get("implementation_steps", [])) for b in branches], dtype=float),
+            context=state.context
+        )
         
-        # Sort by score (descending)
-        scored_branches.sort(key=lambda x: x["composite_score"], reverse=True)
+        for branch, score in zip(branches, scores):
+            branch["composite_score"] = float(score)
         
-        state.branches = scored_branches
-        state.selected_patch = scored_branches[0] if scored_branches else None
+        # Only the top branch is used, so take the max (first on ties) instead of sorting
+        state.selected_patch = branches[int(np.argmax(scores))]
         
         state.reasoning_tree.append({
             "step": "branch_ranking",
-            "top_score": scored_branches[0]["composite_score"] if scored_branches else 0,
+            "top_score": state.selected_patch["composite_score"],
             "selected_branch": state.selected_patch,
-            "timestamp": asyncio.get_event_loop().time()
+            "timestamp": time.monotonic()
         })
         
         return state
@@ -161,7 +178,7 @@ class TreeOfThoughtPlanner:
                 "success": result.get("success", False),
                 "test_results": result.get("test_results", {}),
                 "performance_delta": result.get("performance_delta", 0),
-                "timestamp": asyncio.get_event_loop().time()
+                "timestamp": time.monotonic()
             })
             
         except Exception as e:
@@ -181,7 +198,7 @@ class TreeOfThoughtPlanner:
                 "step": "result_validation",
                 "validation_score": validation_score,
                 "ready_for_deployment": validation_score > 0.8,
-                "timestamp": asyncio.get_event_loop().time()
+                "timestamp": time.monotonic()
             })
         
         return state
@@ -189,22 +206,56 @@ class TreeOfThoughtPlanner:
     async def plan_and_execute(self, query: str, context: Dict[str, Any]) -> AsyncGenerator[Dict[str, Any], None]:
         """Main planning and execution pipeline with streaming updates"""
         
-        initial_state = PlanningState(query=query, context=context)
+        initial_state = PlanningState(
+            query=query,
+            context=context,
+            context_json=orjson.dumps(context, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS).decode()
+        )
+        queue: asyncio.Queue = asyncio.Queue()
         
-        # NOVEL: Stream each step of the reasoning process
-        async for step_result in self.graph.astream(initial_state):
-            yield {
-                "type": "reasoning_step",
-                "content": step_result,
-                "timestamp": asyncio.get_event_loop().time()
-            }
+        async def run_graph():
+            _token_sink.set(queue)
+            try:
+                async for step_result in self.graph.astream(initial_state):
+                    queue.put_nowait({
+                        "type": "reasoning_step",
+                        "content": step_result,
+                        "timestamp": time.monotonic()
+                    })
+            finally:
+                queue.put_nowait(None)
+        
+        # NOVEL: Stream each step of the reasoning process, interleaved with LLM tokens
+        graph_task = asyncio.create_task(run_graph())
+        try:
+            while (item := await queue.get()) is not None:
+                yield item
+            await graph_task
+        finally:
+            graph_task.cancel()
     
-    async def explain_reasoning(self, query: str, retrieved_docs: List[Dict]) -> Dict[str, Any]:
+    async def explain_reasoning(
+        self,
+        query: str,
+        retrieved_docs: List[Dict],
+        query_analysis: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """Generate explainable reasoning tree for transparency"""
         
+        score_docs = asyncio.to_thread(self._score_document_relevance, retrieved_docs, query)
+        
+        if query_analysis is None:
+            # Query analysis and document scoring are independent; run them concurrently
+            query_analysis, document_relevance = await asyncio.gather(
+                self._analyze_query_complexity(query),
+                score_docs
+            )
+        else:
+            document_relevance = await score_docs
+        
         explanation = {
-            "query_analysis": await self._analyze_query_complexity(query),
-            "document_relevance": self._score_document_relevance(retrieved_docs, query),
+            "query_analysis": query_analysis,
+            "document_relevance": document_relevance,
             "reasoning_steps": [],
             "confidence_score": 0.0
         }
@@ -249,3 +300,4 @@ class TreeOfThoughtPlanner:
             "average_execution_time": 0.0,
             "success_rate": 0.0,
             "branch_utilization": {}
+        }
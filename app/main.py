@@ -1,17 +1,35 @@
 # FastAPI entry point for self-fixing AI system
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import asyncio
-import json
+import time
+import orjson
+from contextlib import asynccontextmanager
 from typing import AsyncGenerator, List, Dict, Any
 
 from app.graph.planner import TreeOfThoughtPlanner
 from app.utils.llm import LLMProvider
 from app.utils.rag import RAGRetriever
 
-app = FastAPI(title="Self-Fixing AI System", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build shared components once per worker and release them on shutdown"""
+    # NOVEL: Initialize core components with dependency injection
+    app.state.llm_provider = LLMProvider()
+    app.state.rag_retriever = RAGRetriever()
+    app.state.tot_planner = TreeOfThoughtPlanner(app.state.llm_provider, app.state.rag_retriever)
+    await app.state.tot_planner.sandbox_runner.warm_up()
+    # JIT-compile the scoring kernel now rather than on the first /chat-tot request
+    await asyncio.to_thread(app.state.tot_planner.patch_scorer.warm_up)
+    
+    yield
+    
+    await app.state.tot_planner.sandbox_runner.close()
+    await app.state.llm_provider.aclose()
+
+app = FastAPI(title="Self-Fixing AI System", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,53 +47,70 @@ class ExplainRequest(BaseModel):
     query: str
     include_reasoning: bool = True
 
-# NOVEL: Initialize core components with dependency injection
-llm_provider = LLMProvider()
-rag_retriever = RAGRetriever()
-tot_planner = TreeOfThoughtPlanner(llm_provider, rag_retriever)
+def get_llm_provider(request: Request) -> LLMProvider:
+    return request.app.state.llm_provider
+
+def get_rag_retriever(request: Request) -> RAGRetriever:
+    return request.app.state.rag_retriever
+
+def get_planner(request: Request) -> TreeOfThoughtPlanner:
+    return request.app.state.tot_planner
 
 @app.post("/chat-tot")
-async def chat_with_tree_of_thought(request: ChatRequest):
+async def chat_with_tree_of_thought(
+    request: ChatRequest,
+    tot_planner: TreeOfThoughtPlanner = Depends(get_planner)
+):
     """Main endpoint for Tree-of-Thought enhanced chat with self-fixing capabilities"""
     
-    async def stream_response() -> AsyncGenerator[str, None]:
+    async def stream_response() -> AsyncGenerator[bytes, None]:
         try:
             # NOVEL: Stream reasoning process in real-time
             async for step in tot_planner.plan_and_execute(
                 query=request.message,
                 context=request.context
             ):
-                yield f"data: {json.dumps(step)}\n\n"
+                yield b"data: " + orjson.dumps(step) + b"\n\n"
                 
         except Exception as e:
             error_response = {
                 "type": "error",
                 "content": f"Planning failed: {str(e)}",
-                "timestamp": asyncio.get_event_loop().time()
+                "timestamp": time.monotonic()
             }
-            yield f"data: {json.dumps(error_response)}\n\n"
+            yield b"data: " + orjson.dumps(error_response) + b"\n\n"
     
     return StreamingResponse(
         stream_response(),
-        media_type="text/plain",
+        media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
     )
 
 @app.post("/explain")
-async def explain_reasoning(request: ExplainRequest):
+async def explain_reasoning(
+    request: ExplainRequest,
+    rag_retriever: RAGRetriever = Depends(get_rag_retriever),
+    tot_planner: TreeOfThoughtPlanner = Depends(get_planner)
+):
     """Explainability endpoint showing RAG retrieval + reasoning tree"""
     
     try:
         # NOVEL: Combined RAG + reasoning explanation
-        retrieved_docs = await rag_retriever.retrieve_relevant_docs(
+        docs_task = asyncio.create_task(rag_retriever.retrieve_relevant_docs(
             query=request.query,
             top_k=5
-        )
+        ))
         
         if request.include_reasoning:
+            # Query analysis only needs the query, so overlap it with retrieval
+            retrieved_docs, query_analysis = await asyncio.gather(
+                docs_task,
+                tot_planner._analyze_query_complexity(request.query)
+            )
             reasoning_tree = await tot_planner.explain_reasoning(
                 query=request.query,
-                retrieved_docs=retrieved_docs
+                retrieved_docs=retrieved_docs,
+                query_analysis=query_analysis
             )
             
             return {
@@ -84,13 +119,17 @@ async def explain_reasoning(request: ExplainRequest):
                 "explainability_score": tot_planner.calculate_explainability_score(reasoning_tree)
             }
         
-        return {"retrieved_docs": retrieved_docs}
+        return {"retrieved_docs": await docs_task}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Explanation failed: {str(e)}")
 
 @app.get("/health")
-async def health_check():
+async def health_check(
+    llm_provider: LLMProvider = Depends(get_llm_provider),
+    rag_retriever: RAGRetriever = Depends(get_rag_retriever),
+    tot_planner: TreeOfThoughtPlanner = Depends(get_planner)
+):
     """System health check including component status"""
     return {
         "status": "healthy",
@@ -102,7 +141,7 @@ async def health_check():
     }
 
 @app.get("/metrics")
-async def get_metrics():
+async def get_metrics(tot_planner: TreeOfThoughtPlanner = Depends(get_planner)):
     """System metrics for monitoring and optimization"""
     return await tot_planner.get_performance_metrics()
 
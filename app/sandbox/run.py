@@ -1,19 +1,195 @@
 # Isolated sandbox for safe patch execution and testing
-import docker
+import aiodocker
 import asyncio
+import io
+import tarfile
 import tempfile
+import time
 import os
-import json
+import orjson
 import shutil
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
+from collections import deque
+import re
 import subprocess
 
+# Packages baked into Dockerfile.sandbox; containers have no network, so nothing else can be installed
+_PREINSTALLED = frozenset({
+    "pytest", "pytest-json-report", "requests", "urllib3", "sqlalchemy", "numpy", "pandas"
+})
+
+# Prefix of the single log line carrying the patch run's JSON results
+_RESULT_SENTINEL = "__RESULT__:"
+_RESULT_SENTINEL_BYTES = _RESULT_SENTINEL.encode()
+
+# Run as the sandbox user between patches: kill(-1) signals every process except PID 1
+# (the idle `sleep`) and the caller, then every location the user can write to is wiped
+_RESET_CMD = [
+    "sh", "-c",
+    "kill -9 -1 2>/dev/null; find /workspace /tmp /var/tmp /dev/shm -mindepth 1 -delete"
+]
+
+# Cap on patch output kept in memory for the fallback "logs" field
+_MAX_LOG_BYTES = 1024 * 1024
+
 class SandboxRunner:
-    def __init__(self, base_image: str = "python:3.11-slim"):
-        self.client = docker.from_env()
+    def __init__(
+        self,
+        base_image: str = os.getenv("SANDBOX_IMAGE", "self-fixing-sandbox:latest"),
+        pool_size: int = 2,
+        max_runs_per_container: int = 20
+    ):
+        self._docker: Optional[aiodocker.Docker] = None
         self.base_image = base_image
         self.timeout = 300  # 5 minutes default
+        
+        # NOVEL: Warm pool of idle containers; patches are exec'd into them
+        self.pool_size = pool_size
+        self.max_runs_per_container = max_runs_per_container
+        self._idle: List[Any] = []
+        self._live_containers = 0
+        # Signalled whenever a container goes idle or a live slot frees up
+        self._pool_changed = asyncio.Condition()
+        self._run_counts: Dict[str, int] = {}
+    
+    @property
+    def docker(self) -> aiodocker.Docker:
+        """Lazily connect to the Docker engine (needs a running event loop)"""
+        if self._docker is None:
+            self._docker = aiodocker.Docker()
+        return self._docker
+    
+    async def warm_up(self):
+        """Start idle containers until the pool is full"""
+        while self._live_containers < self.pool_size:
+            self._live_containers += 1
+            try:
+                container = await self._start_container()
+            except Exception:
+                # Engine unavailable; _acquire_container starts containers on demand later
+                await self._free_slot()
+                break
+            await self._put_idle(container)
+    
+    async def close(self):
+        """Remove pooled containers and close the Docker engine connection"""
+        while self._idle:
+            await self._discard_container(self._idle.pop())
+        if self._docker is not None:
+            await self._docker.close()
+            self._docker = None
+    
+    def _container_config(self) -> Dict[str, Any]:
+        """Config for an idle sandbox container with security constraints"""
+        return {
+            "Image": self.base_image,
+            "Cmd": ["sleep", "infinity"],
+            "WorkingDir": "/workspace",
+            "NetworkDisabled": True,  # No network access
+            "User": "nobody",  # Non-root execution
+            "HostConfig": {
+                "Memory": 512 * 1024 * 1024,  # Memory limit
+                "CpuQuota": 50000,   # CPU limit
+                "SecurityOpt": ["no-new-privileges"]
+            }
+        }
+    
+    async def _start_container(self):
+        """Start a fresh idle container from the sandbox image"""
+        container = await self.docker.containers.run(config=self._container_config())
+        self._run_counts[container.id] = 0
+        return container
+    
+    async def _acquire_container(self, timeout: float):
+        """Take an idle container, or start one while fewer than pool_size are live"""
+        async with self._pool_changed:
+            try:
+                await asyncio.wait_for(
+                    self._pool_changed.wait_for(
+                        lambda: self._idle or self._live_containers < self.pool_size
+                    ),
+                    timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                raise RuntimeError(f"No sandbox container available after {timeout} seconds")
+            
+            if self._idle:
+                return self._idle.pop()
+            self._live_containers += 1
+        
+        try:
+            return await self._start_container()
+        except BaseException:
+            await self._free_slot()
+            raise
+    
+    async def _put_idle(self, container):
+        """Return a container to the idle pool and wake one waiter"""
+        async with self._pool_changed:
+            self._idle.append(container)
+            self._pool_changed.notify()
+    
+    async def _free_slot(self):
+        """Give up a live slot (a container was discarded or never started) and wake one waiter"""
+        async with self._pool_changed:
+            self._live_containers -= 1
+            self._pool_changed.notify()
+    
+    async def _release_container(self, container):
+        """Reset and return a container to the pool, or replace it once worn out or broken"""
+        runs = self._run_counts.get(container.id, 0) + 1
+        if runs < self.max_runs_per_container:
+            try:
+                # Stray processes from the last patch could otherwise tamper with the next run
+                _, exit_code = await self._exec(container, _RESET_CMD)
+                if exit_code == 0:
+                    self._run_counts[container.id] = runs
+                    await self._put_idle(container)
+                    return
+            except Exception:
+                pass
+        
+        # The freed slot is refilled on demand by the next _acquire_container, off this request's path
+        await self._discard_container(container)
+    
+    async def _discard_container(self, container):
+        """Remove a container from the pool for good"""
+        self._run_counts.pop(container.id, None)
+        try:
+            await container.delete(force=True)
+        except:
+            pass
+        await self._free_slot()
+    
+    async def _exec(self, container, cmd, workdir: str = "/workspace"):
+        """Run a command in a container and return its combined output and exit code"""
+        exec_ = await container.exec(cmd=cmd, stdout=True, stderr=True, workdir=workdir)
+        chunks = []
+        async with exec_.start(detach=False) as stream:
+            while (message := await stream.read_out()) is not None:
+                chunks.append(message.data)
+        return b"".join(chunks).decode("utf-8", "replace"), await self._wait_exit_code(exec_)
+    
+    async def _wait_exit_code(self, exec_) -> Optional[int]:
+        """Exit code of an exec whose output hit EOF, polling until Docker stops reporting it Running"""
+        inspect = await exec_.inspect()
+        while inspect.get("Running"):
+            await asyncio.sleep(0.05)
+            inspect = await exec_.inspect()
+        return inspect.get("ExitCode")
+    
+    def _workspace_archive(self, temp_dir: str) -> bytes:
+        """Tar the prepared patch dir, owned by the sandbox user, for put_archive"""
+        def as_sandbox_user(info: tarfile.TarInfo) -> tarfile.TarInfo:
+            info.uid = info.gid = 65534
+            info.uname, info.gname = "nobody", "nogroup"
+            return info
+        
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            tar.add(os.path.join(temp_dir, "patch"), arcname="patch", filter=as_sandbox_user)
+        return buffer.getvalue()
     
     async def run_patch(self, patch_data: Dict[str, Any], timeout: int = None) -> Dict[str, Any]:
         """Execute patch in isolated Docker container with comprehensive metrics"""
@@ -22,36 +198,24 @@ class SandboxRunner:
         
         # NOVEL: Create isolated execution environment with resource limits
         with tempfile.TemporaryDirectory() as temp_dir:
+            container = None
+            finished = False
             try:
-                # Prepare patch files
-                patch_path = await self._prepare_patch_files(patch_data, temp_dir)
+                # Fail fast: without network access, requirements outside the image can't be installed
+                unavailable = self._unavailable_requirements(patch_data)
+                if unavailable:
+                    raise ValueError(f"Requirements not available in sandbox image: {', '.join(unavailable)}")
                 
-                # NOVEL: Docker-in-Docker with security constraints
-                container_config = {
-                    "image": self.base_image,
-                    "command": [
-                        "python", "-c", 
-                        f"exec(open('{patch_path}/execute_patch.py').read())"
-                    ],
-                    "volumes": {temp_dir: {"bind": "/workspace", "mode": "rw"}},
-                    "working_dir": "/workspace",
-                    "mem_limit": "512m",  # Memory limit
-                    "cpu_quota": 50000,   # CPU limit
-                    "network_disabled": True,  # No network access
-                    "security_opt": ["no-new-privileges"],
-                    "user": "nobody"  # Non-root execution
-                }
+                # Prepare patch files
+                await self._prepare_patch_files(patch_data, temp_dir)
                 
-                start_time = asyncio.get_event_loop().time()
+                container = await self._acquire_container(execution_timeout)
+                await container.put_archive("/workspace", self._workspace_archive(temp_dir))
                 
-                # Run container with timeout
-                container = self.client.containers.run(
-                    detach=True,
-                    **container_config
-                )
+                start_time = time.monotonic()
                 
                 # NOVEL: Async monitoring with timeout handling
-                result = await self._monitor_execution(
+                result, finished = await self._monitor_execution(
                     container, 
                     execution_timeout,
                     start_time
@@ -68,6 +232,14 @@ class SandboxRunner:
                     "performance_delta": 0,
                     "risk_score": 1.0  # High risk on failure
                 }
+            
+            finally:
+                if container is not None:
+                    if finished:
+                        await self._release_container(container)
+                    else:
+                        # Timeout, error or cancellation: the patch may still be running, so never reuse
+                        await asyncio.shield(self._discard_container(container))
     
     async def _prepare_patch_files(self, patch_data: Dict[str, Any], temp_dir: str) -> str:
         """Prepare patch files and test environment"""
@@ -93,6 +265,19 @@ class SandboxRunner:
         
         return patch_dir
     
+    @staticmethod
+    def _requirement_name(requirement: str) -> str:
+        """Normalized distribution name of a requirement specifier"""
+        name = re.split(r"[<>=!~\[;\s]", requirement.strip(), maxsplit=1)[0]
+        return name.lower().replace("_", "-")
+    
+    def _unavailable_requirements(self, patch_data: Dict[str, Any]) -> List[str]:
+        """Requirements of a patch that the sandbox image does not provide"""
+        return [
+            req for req in patch_data.get("requirements", ["pytest"])
+            if self._requirement_name(req) not in _PREINSTALLED
+        ]
+    
     def _generate_patch_script(self, patch_data: Dict[str, Any]) -> str:
         """Generate executable Python script from patch data"""
         
@@ -107,20 +292,15 @@ def execute_patch():
     """Execute the patch and collect metrics"""
     
     start_time = time.time()
-    results = {
+    results = {{
         "success": False,
-        "test_results": {},
+        "test_results": {{}},
         "performance_delta": 0,
         "execution_time": 0,
         "logs": []
-    }
+    }}
     
     try:
-        # NOVEL: Install dependencies safely
-        subprocess.run([
-            sys.executable, "-m", "pip", "install", "-r", "requirements.txt"
-        ], check=True, capture_output=True, text=True)
-        
         # Execute patch logic
         {patch_logic}
         
@@ -129,11 +309,11 @@ def execute_patch():
             sys.executable, "-m", "pytest", "run_tests.py", "-v", "--json-report"
         ], capture_output=True, text=True)
         
-        results["test_results"] = {
+        results["test_results"] = {{
             "return_code": test_result.returncode,
             "stdout": test_result.stdout,
             "stderr": test_result.stderr
-        }
+        }}
         
         results["success"] = test_result.returncode == 0
         results["execution_time"] = time.time() - start_time
@@ -143,10 +323,10 @@ def execute_patch():
         
     except Exception as e:
         results["error"] = str(e)
-        results["logs"].append(f"Execution failed: {str(e)}")
+        results["logs"].append(f"Execution failed: {{str(e)}}")
     
-    # Output results as JSON
-    print(json.dumps(results))
+    # Output results as JSON on a single sentinel-prefixed line
+    print({result_sentinel!r} + json.dumps(results))
     return results
 
 def measure_performance_impact():
@@ -157,7 +337,8 @@ def measure_performance_impact():
 if __name__ == "__main__":
     execute_patch()
         '''.format(
-            patch_logic=patch_data.get("implementation_code", "pass  # No implementation provided")
+            patch_logic=patch_data.get("implementation_code", "pass  # No implementation provided"),
+            result_sentinel=_RESULT_SENTINEL
         )
         
         return script_template
@@ -199,57 +380,102 @@ if __name__ == "__main__":
         
         return test_template
     
-    async def _monitor_execution(self, container, timeout: int, start_time: float) -> Dict[str, Any]:
-        """Monitor container execution with timeout and resource tracking"""
+    async def _monitor_execution(self, container, timeout: int, start_time: float) -> Tuple[Dict[str, Any], bool]:
+        """Monitor container execution with timeout; also reports whether the patch process finished"""
         
         try:
             # NOVEL: Async container monitoring with resource tracking
-            await asyncio.wait_for(
-                self._wait_for_container(container),
+            result, logs, exit_code = await asyncio.wait_for(
+                self._stream_patch_output(container),
                 timeout=timeout
             )
             
-            # Get container logs
-            logs = container.logs(decode=True)
-            
-            # Parse results from logs
-            try:
-                # Find JSON output in logs
-                for line in logs.split('\n'):
-                    if line.strip().startswith('{'):
-                        result = json.loads(line.strip())
-                        result["total_execution_time"] = asyncio.get_event_loop().time() - start_time
-                        return result
-            except json.JSONDecodeError:
-                pass
+            if result is not None:
+                result["exit_code"] = exit_code
+                result["total_execution_time"] = time.monotonic() - start_time
+                return result, True
             
             # Fallback result
             return {
                 "success": False,
                 "error": "Could not parse execution results",
+                "exit_code": exit_code,
                 "logs": logs,
-                "total_execution_time": asyncio.get_event_loop().time() - start_time
-            }
+                "total_execution_time": time.monotonic() - start_time
+            }, True
             
         except asyncio.TimeoutError:
-            container.kill()
+            # The exec can't be cancelled on its own; the caller discards the container
             return {
                 "success": False,
                 "error": f"Execution timeout after {timeout} seconds",
                 "total_execution_time": timeout
-            }
+            }, False
+    
+    async def _stream_patch_output(self, container) -> Tuple[Optional[Dict[str, Any]], str, Optional[int]]:
+        """Run the patch, parse its output as it streams, and wait for its exit code"""
+        
+        exec_ = await container.exec(
+            cmd=["python", "execute_patch.py"],
+            stdout=True,
+            stderr=True,
+            workdir="/workspace/patch"
+        )
+        
+        parser = _PatchOutputParser()
+        
+        # Drain to EOF even after the result line, so the process has exited before inspect
+        async with exec_.start(detach=False) as stream:
+            while (message := await stream.read_out()) is not None:
+                parser.feed(message.stream, message.data)
+        
+        exit_code = await self._wait_exit_code(exec_)
+        
+        result, logs = parser.finish()
+        return result, logs, exit_code
+
+class _PatchOutputParser:
+    """Incremental parser for patch output: finds the sentinel result line, keeps a bounded log tail"""
+    
+    def __init__(self, max_log_bytes: int = _MAX_LOG_BYTES):
+        self.max_log_bytes = max_log_bytes
+        self.result: Optional[Dict[str, Any]] = None
+        self._tail: deque = deque()  # Most recent output lines, bounded by max_log_bytes
+        self._tail_bytes = 0
+        self._pending = {1: b"", 2: b""}  # Partial line per stream (stdout, stderr)
+    
+    def feed(self, stream_id: int, data: bytes):
+        """Consume one chunk of a stream's output"""
+        *lines, pending = (self._pending.get(stream_id, b"") + data).split(b"\n")
         
-        finally:
-            # Cleanup
+        # Flush oversized partial lines, except the result line, which must stay whole to parse
+        if len(pending) > self.max_log_bytes and not pending.startswith(_RESULT_SENTINEL_BYTES):
+            lines.append(pending)
+            pending = b""
+        self._pending[stream_id] = pending
+        
+        for line in lines:
+            self._consume_line(line)
+    
+    def finish(self) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Flush partial lines and return the parsed result (if any) and the log tail"""
+        for stream_id, pending in self._pending.items():
+            if pending:
+                self._pending[stream_id] = b""
+                self._consume_line(pending)
+        return self.result, b"\n".join(self._tail).decode("utf-8", "replace")
+    
+    def _consume_line(self, line: bytes):
+        if self.result is None and line.startswith(_RESULT_SENTINEL_BYTES):
             try:
-                container.remove(force=True)
-            except:
+                self.result = orjson.loads(line[len(_RESULT_SENTINEL_BYTES):])
+                return
+            except orjson.JSONDecodeError:
                 pass
-    
-    async def _wait_for_container(self, container):
-        """Wait for container to complete execution"""
-        while True:
-            container.reload()
-            if container.status != 'running':
-                break
-            await asyncio.sleep(0.1)
+        
+        # Only the tail is kept; the head of an oversized line is dropped
+        line = line[-self.max_log_bytes:]
+        self._tail.append(line)
+        self._tail_bytes += len(line) + 1
+        while self._tail_bytes > self.max_log_bytes and len(self._tail) > 1:
+            self._tail_bytes -= len(self._tail.popleft()) + 1
@@ -1,32 +1,80 @@
 # LLM provider abstraction for easy model swapping
 import openai
 import asyncio
-from typing import Optional, Dict, Any
+import diskcache
+import hashlib
+import httpx
+import orjson
+from typing import Optional, Dict, Any, AsyncGenerator
 import os
 
 class LLMProvider:
-    def __init__(self, model: str = "gpt-4o-mini"):
+    def __init__(self, model: str = "gpt-4o-mini", cache_dir: Optional[str] = None):
         self.model = model
+        # Pooled HTTP/2 connections so concurrent calls reuse TLS sessions
+        self.http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            timeout=60.0
+        )
         self.client = openai.AsyncOpenAI(
-            api_key=os.getenv("OPENAI_API_KEY")
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=self.http_client
         )
+        # Persistent response cache keyed by (model, prompt, kwargs)
+        self.cache = diskcache.Cache(cache_dir or os.getenv("LLM_CACHE_DIR", "/tmp/llm_cache"))
+    
+    def _cache_key(self, prompt: str, kwargs: Dict[str, Any]) -> str:
+        """Stable cache key for a completion request"""
+        payload = f"{self.model}|{prompt}|{orjson.dumps(kwargs, option=orjson.OPT_SORT_KEYS, default=str).decode()}"
+        return hashlib.sha256(payload.encode()).hexdigest()
     
-    async def generate_async(self, prompt: str, **kwargs) -> str:
-        """Generate response asynchronously"""
+    async def generate_stream_async(self, prompt: str, use_cache: bool = True, **kwargs) -> AsyncGenerator[str, None]:
+        """Stream response tokens as they arrive (cache hits yield a single chunk)"""
+        key = self._cache_key(prompt, kwargs) if use_cache else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+        
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            **kwargs
+        )
+        
+        chunks = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content or ""
+            if token:
+                chunks.append(token)
+                yield token
+        
+        if key is not None:
+            self.cache.set(key, "".join(chunks))
+    
+    async def generate_async(self, prompt: str, use_cache: bool = True, **kwargs) -> str:
+        """Generate response asynchronously (use_cache=False for non-deterministic calls)"""
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                **kwargs
-            )
-            return response.choices[0].message.content
+            return "".join([
+                token async for token in self.generate_stream_async(prompt, use_cache=use_cache, **kwargs)
+            ])
         except Exception as e:
             return f"Error: {str(e)}"
     
+    async def aclose(self):
+        """Close pooled HTTP connections and the response cache"""
+        await self.client.close()
+        self.cache.close()
+    
     async def health_check(self) -> bool:
         """Check if LLM provider is healthy"""
         try:
-            await self.generate_async("test", max_tokens=1)
+            await self.generate_async("test", use_cache=False, max_tokens=1)
             return True
         except:
             return False
@@ -1,16 +1,49 @@
 # RAG retrieval system for context-aware responses
 import pinecone
 import asyncio
-from typing import List, Dict, Any
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple
 import os
 
 class RAGRetriever:
-    def __init__(self):
+    def __init__(self, cache_size: int = 1024, cache_ttl: float = 300.0):
         # Initialize Pinecone (simplified for demo)
         self.index_name = "knowledge-base"
+        
+        # TTL + LRU cache of (query, top_k) -> (created_at, in-flight or finished lookup)
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[float, asyncio.Future]]" = OrderedDict()
     
     async def retrieve_relevant_docs(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        """Retrieve relevant documents for the query"""
+        """Retrieve relevant documents for the query (cached; identical concurrent calls share one lookup)"""
+        key = (query, top_k)
+        now = time.monotonic()
+        
+        entry = self._cache.get(key)
+        if entry is not None and now - entry[0] < self.cache_ttl:
+            self._cache.move_to_end(key)
+            return await asyncio.shield(entry[1])
+        
+        future = asyncio.ensure_future(self._search(query, top_k))
+        # Evict on completion, not in this caller: the shielded lookup outlives a cancelled caller
+        future.add_done_callback(lambda done: self._evict_if_failed(key, done))
+        self._cache[key] = (now, future)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        
+        return await asyncio.shield(future)
+    
+    def _evict_if_failed(self, key: Tuple[str, int], future: asyncio.Future):
+        """Never cache failures"""
+        if future.cancelled() or future.exception() is not None:
+            if self._cache.get(key, (None, None))[1] is future:
+                del self._cache[key]
+    
+    async def _search(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+        """Run the vector-store lookup"""
         # NOVEL: Semantic similarity search with metadata
         return [
             {
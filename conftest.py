@@ -0,0 +1 @@
+# Makes the repo root importable for tests run as `pytest tests/`
@@ -1,26 +1,100 @@
 # Forward-looking CVE scanner for proactive vulnerability detection
 import asyncio
-import feedparser
+import diskcache
+import hashlib
+import httpx
+import numpy as np
 import requests
-import json
+import orjson
 import argparse
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, FrozenSet, Iterable
 import openai
 import os
+from lxml import etree
+
+# libuv-backed event loop when available; falls back to the stdlib loop
+try:
+    import uvloop
+    _LOOP_FACTORY = uvloop.new_event_loop
+except ImportError:
+    _LOOP_FACTORY = None
+
+# One pooled HTTP/2 client shared by every scanner, so concurrent OpenAI calls multiplex over warm connections
+_shared_http_client = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(60.0, connect=5.0),
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=30)
+)
+
+# CVRF vulnerability records, parsed one element at a time from the streamed feed
+CVRF_VULN_TAG = "{http://www.icasi.org/CVRF/schema/vuln/1.1}Vulnerability"
+FEED_CHUNK_SIZE = 65536
+
+# Severity weights for impact scoring
+SEV_WEIGHTS = {
+    "critical": 1.0,
+    "high": 0.8,
+    "medium": 0.6,
+    "low": 0.4
+}
+
+# Generated patches are reused for this long before a CVE is re-analysed
+PATCH_CACHE_TTL = 30 * 86400
+
+# Structured-output schema for generated patches (strict mode: every field required)
+PATCH_SCHEMA = {
+    "name": "cve_patch",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "root_cause_analysis": {"type": "string"},
+            "patch_strategy": {"type": "string"},
+            "code_changes": {"type": "string"},
+            "testing_recommendations": {"type": "array", "items": {"type": "string"}},
+            "confidence": {"type": "number"}
+        },
+        "required": [
+            "root_cause_analysis",
+            "patch_strategy",
+            "code_changes",
+            "testing_recommendations",
+            "confidence"
+        ],
+        "additionalProperties": False
+    }
+}
 
 class ForwardScanner:
-    def __init__(self):
-        self.openai_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(
+        self,
+        model: str = "gpt-4o-mini",
+        cache_dir: str = ".cve_cache",
+        concurrency: int = 16,
+        live_cve_feed: bool = False
+    ):
+        self.openai_client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=_shared_http_client
+        )
+        self.model = model
+        # Content-addressed cache of parsed patches keyed by (model, prompt)
+        self._cache = diskcache.Cache(cache_dir)
+        self.concurrency = concurrency
+        # MITRE's CVRF feed carries no CVSS scores, so live records only match --severity unknown
+        self.live_cve_feed = live_cve_feed
         self.cve_feeds = {
             'cve': 'https://cve.mitre.org/data/downloads/allitems-cvrf.xml',
             'npm': 'https://github.com/advisories?query=ecosystem%3Anpm',
             'pypi': 'https://pyup.io/safety/data/'
         }
     
-    async def scan_vulnerabilities(self, feeds: List[str], severity_filter: List[str]) -> List[Dict[str, Any]]:
+    async def scan_vulnerabilities(self, feeds: List[str], severity_filter: Iterable[str]) -> List[Dict[str, Any]]:
         """Scan multiple feeds for new vulnerabilities"""
         
+        # Set membership for the per-vulnerability severity check
+        severity_filter = frozenset(severity_filter)
         vulnerabilities = []
         
         for feed_name in feeds:
@@ -31,9 +105,16 @@ class ForwardScanner:
         
         return vulnerabilities
     
-    async def _scan_feed(self, feed_name: str, severity_filter: List[str]) -> List[Dict[str, Any]]:
+    async def _scan_feed(self, feed_name: str, severity_filter: FrozenSet[str]) -> List[Dict[str, Any]]:
         """Scan individual vulnerability feed"""
         
+        if feed_name == "cve" and self.live_cve_feed:
+            try:
+                return await self._scan_cvrf_feed(self.cve_feeds["cve"], severity_filter)
+            except (httpx.HTTPError, etree.LxmlError) as e:
+                print(f"Warning: failed to scan {feed_name} feed: {e}")
+                return []
+        
         # Simplified implementation - in production would parse actual CVE feeds
         mock_vulnerabilities = [
             {
@@ -62,29 +143,108 @@ class ForwardScanner:
         
         return filtered_vulns
     
-    async def generate_patch_candidates(self, vulnerabilities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Generate patch candidates for detected vulnerabilities"""
+    async def _scan_cvrf_feed(self, url: str, severity_filter: FrozenSet[str]) -> List[Dict[str, Any]]:
+        """Stream a CVRF XML feed, holding only one Vulnerability element in memory at a time"""
+        
+        parser = etree.XMLPullParser(events=("end",), tag=CVRF_VULN_TAG)
+        vulnerabilities = []
         
-        patch_candidates = []
+        def drain():
+            for _, elem in parser.read_events():
+                vuln = self._parse_cvrf_vulnerability(elem)
+                if vuln["severity"] in severity_filter:
+                    vulnerabilities.append(vuln)
+                
+                # Free the element and every already-processed sibling before it
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
         
-        for vuln in vulnerabilities:
-            # NOVEL: AI-powered patch generation
-            patch = await self._generate_patch(vuln)
-            
-            if patch:
-                patch_candidates.append({
-                    "vulnerability": vuln,
-                    "patch": patch,
-                    "confidence": patch.get("confidence", 0.0),
-                    "impact_score": self._calculate_impact_score(vuln, patch)
-                })
-        
-        return patch_candidates
+        async with _shared_http_client.stream("GET", url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(FEED_CHUNK_SIZE):
+                parser.feed(chunk)
+                drain()
+        
+        parser.close()
+        drain()
+        
+        return vulnerabilities
     
-    async def _generate_patch(self, vulnerability: Dict[str, Any]) -> Dict[str, Any]:
-        """Generate patch for specific vulnerability using AI"""
+    def _parse_cvrf_vulnerability(self, elem: etree._Element) -> Dict[str, Any]:
+        """Extract the scanner's vulnerability record from one CVRF Vulnerability element"""
+        
+        ns = {"v": etree.QName(elem).namespace}
+        score = elem.findtext("v:CVSSScoreSets/v:ScoreSet/v:BaseScore", namespaces=ns)
+        score = float(score) if score else None
+        
+        return {
+            "id": elem.findtext("v:CVE", namespaces=ns) or elem.findtext("v:Title", default="", namespaces=ns),
+            "severity": self._severity_from_score(score),
+            "description": elem.findtext("v:Notes/v:Note[@Type='Description']", default="", namespaces=ns).strip(),
+            "affected_packages": [],
+            "published": elem.findtext("v:Notes/v:Note[@Title='Published']", default="", namespaces=ns),
+            "score": score
+        }
+    
+    def _severity_from_score(self, score: Optional[float]) -> str:
+        """Map a CVSS v3 base score to its qualitative severity band"""
+        if score is None:
+            return "unknown"
+        if score >= 9.0:
+            return "critical"
+        if score >= 7.0:
+            return "high"
+        if score >= 4.0:
+            return "medium"
+        return "low"
+    
+    async def generate_patch_candidates(
+        self,
+        vulnerabilities: List[Dict[str, Any]],
+        batched: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Generate patch candidates for detected vulnerabilities"""
+        
+        if batched:
+            patches = await self.generate_patches_batched(vulnerabilities)
+        else:
+            # NOVEL: AI-powered patch generation, fanned out under a concurrency cap
+            semaphore = asyncio.Semaphore(self.concurrency)
+            
+            async def generate(vuln: Dict[str, Any]) -> Dict[str, Any]:
+                async with semaphore:
+                    return await self._generate_patch(vuln)
+            
+            patches = await asyncio.gather(
+                *(generate(vuln) for vuln in vulnerabilities),
+                return_exceptions=True
+            )
+        
+        pairs = [
+            (vuln, self._error_patch(patch) if isinstance(patch, Exception) else patch)
+            for vuln, patch in zip(vulnerabilities, patches)
+        ]
+        pairs = [(vuln, patch) for vuln, patch in pairs if patch]
+        
+        impact_scores = self._calculate_impact_scores(
+            [vuln for vuln, _ in pairs],
+            [patch for _, patch in pairs]
+        )
         
-        prompt = f"""
+        return [
+            {
+                "vulnerability": vuln,
+                "patch": patch,
+                "confidence": patch.get("confidence", 0.0),
+                "impact_score": score
+            }
+            for (vuln, patch), score in zip(pairs, impact_scores.tolist())
+        ]
+    
+    def _patch_prompt(self, vulnerability: Dict[str, Any]) -> str:
+        """Build the patch-generation prompt for a vulnerability"""
+        return f"""
         Analyze this vulnerability and generate a patch:
         
         CVE ID: {vulnerability['id']}
@@ -101,39 +261,134 @@ class ForwardScanner:
         
         Return as JSON.
         """
+    
+    def _cache_key(self, prompt: str) -> str:
+        """Patch cache key for a prompt under the current model"""
+        return hashlib.blake2b(f"{self.model}|{prompt}".encode()).hexdigest()
+    
+    def _completion_body(self, prompt: str) -> Dict[str, Any]:
+        """Chat completion request body; the strict schema guarantees parseable JSON"""
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": 1000,
+            "response_format": {"type": "json_schema", "json_schema": PATCH_SCHEMA}
+        }
+    
+    def _error_patch(self, error: Any) -> Dict[str, Any]:
+        """Placeholder patch for a vulnerability that could not be analysed"""
+        return {
+            "error": str(error),
+            "confidence": 0.0,
+            "patch_strategy": "Manual review required"
+        }
+    
+    async def _generate_patch(self, vulnerability: Dict[str, Any]) -> Dict[str, Any]:
+        """Generate patch for specific vulnerability using AI"""
+        
+        prompt = self._patch_prompt(vulnerability)
+        
+        key = self._cache_key(prompt)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
         
         try:
             response = await self.openai_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=1000
+                **self._completion_body(prompt)
             )
             
-            return json.loads(response.choices[0].message.content)
+            patch = orjson.loads(response.choices[0].message.content)
+            self._cache.set(key, patch, expire=PATCH_CACHE_TTL)
+            return patch
             
         except Exception as e:
-            return {
-                "error": str(e),
-                "confidence": 0.0,
-                "patch_strategy": "Manual review required"
-            }
+            return self._error_patch(e)
     
-    def _calculate_impact_score(self, vulnerability: Dict[str, Any], patch: Dict[str, Any]) -> float:
-        """Calculate impact score for prioritization"""
+    async def generate_patches_batched(
+        self,
+        vulnerabilities: List[Dict[str, Any]],
+        poll_interval: float = 30.0
+    ) -> List[Dict[str, Any]]:
+        """Generate patches for uncached vulnerabilities in one OpenAI Batch job (non-realtime)"""
         
-        # NOVEL: Multi-factor impact scoring
-        severity_weights = {
-            "critical": 1.0,
-            "high": 0.8,
-            "medium": 0.6,
-            "low": 0.4
-        }
+        prompts = [self._patch_prompt(vuln) for vuln in vulnerabilities]
+        keys = [self._cache_key(prompt) for prompt in prompts]
+        patches: List[Any] = [self._cache.get(key) for key in keys]
+        
+        pending = [i for i, patch in enumerate(patches) if patch is None]
+        if not pending:
+            return patches
+        
+        try:
+            batch_input = b"".join(
+                orjson.dumps({
+                    "custom_id": str(i),
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": self._completion_body(prompts[i])
+                }) + b"\n"
+                for i in pending
+            )
+            
+            input_file = await self.openai_client.files.create(
+                file=("patch_requests.jsonl", batch_input),
+                purpose="batch"
+            )
+            batch = await self.openai_client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h"
+            )
+            
+            while batch.status not in ("completed", "failed", "expired", "cancelled"):
+                await asyncio.sleep(poll_interval)
+                batch = await self.openai_client.batches.retrieve(batch.id)
+            
+            if batch.status == "completed" and batch.output_file_id:
+                output = await self.openai_client.files.content(batch.output_file_id)
+                for line in output.content.splitlines():
+                    if not line.strip():
+                        continue
+                    record = orjson.loads(line)
+                    i = int(record["custom_id"])
+                    try:
+                        content = record["response"]["body"]["choices"][0]["message"]["content"]
+                        patches[i] = orjson.loads(content)
+                        self._cache.set(keys[i], patches[i], expire=PATCH_CACHE_TTL)
+                    except (KeyError, IndexError, TypeError, ValueError) as e:
+                        patches[i] = self._error_patch(record.get("error") or e)
+            
+            failure = f"Batch {batch.id} ended with status {batch.status}"
+            
+        except Exception as e:
+            failure = str(e)
         
-        base_score = severity_weights.get(vulnerability["severity"], 0.5)
-        confidence_factor = patch.get("confidence", 0.5)
-        package_popularity = 0.8  # Would be calculated from download stats
+        return [patch if patch is not None else self._error_patch(failure) for patch in patches]
+    
+    def _calculate_impact_scores(
+        self,
+        vulnerabilities: List[Dict[str, Any]],
+        patches: List[Dict[str, Any]]
+    ) -> np.ndarray:
+        """Calculate impact scores for prioritization, vectorized over all candidates"""
         
-        return base_score * confidence_factor * package_popularity
+        # NOVEL: Multi-factor impact scoring
+        # float64 matches the scalar math, so reports show 0.8 rather than 0.800000011920929
+        count = len(patches)
+        severities = np.fromiter(
+            (SEV_WEIGHTS.get(vuln["severity"], 0.5) for vuln in vulnerabilities),
+            dtype=np.float64,
+            count=count
+        )
+        confidences = np.fromiter(
+            (patch.get("confidence", 0.5) for patch in patches),
+            dtype=np.float64,
+            count=count
+        )
+        popularities = np.full(count, 0.8, dtype=np.float64)  # Would be calculated from download stats
+        
+        return severities * confidences * popularities
 
 async def main():
     parser = argparse.ArgumentParser(description="Forward-looking CVE scanner")
@@ -141,41 +396,57 @@ async def main():
     parser.add_argument("--severity", nargs="+", default=["critical", "high"], help="Severity levels")
     parser.add_argument("--dry-run", action="store_true", help="Dry run mode")
     parser.add_argument("--output-format", default="json", help="Output format")
+    parser.add_argument("--batch", action="store_true", help="Use the OpenAI Batch API (cheaper, not realtime)")
+    parser.add_argument(
+        "--live-cve-feed",
+        action="store_true",
+        help="Stream MITRE's CVRF feed instead of sample data (unscored: use --severity unknown)"
+    )
     
     args = parser.parse_args()
     
-    scanner = ForwardScanner()
-    
-    # Scan for vulnerabilities
-    vulnerabilities = await scanner.scan_vulnerabilities(args.feeds, args.severity)
-    
-    if not args.dry_run:
-        # Generate patches
-        patch_candidates = await scanner.generate_patch_candidates(vulnerabilities)
-        
-        # Save results
-        results = {
-            "scan_timestamp": datetime.now().isoformat(),
-            "vulnerabilities_found": len(vulnerabilities),
-            "patch_candidates": patch_candidates,
-            "high_risk_findings": [
-                candidate for candidate in patch_candidates 
-                if candidate["impact_score"] > 0.8
-            ]
-        }
-        
-        with open("cve_scan_results.json", "w") as f:
-            json.dump(results, f, indent=2)
+    try:
+        scanner = ForwardScanner(live_cve_feed=args.live_cve_feed)
         
-        # Save high-risk findings separately for GitHub Actions
-        with open("high_risk_findings.json", "w") as f:
-            json.dump(results["high_risk_findings"], f, indent=2)
+        # Scan for vulnerabilities
+        vulnerabilities = await scanner.scan_vulnerabilities(args.feeds, args.severity)
         
-        print(f"Scan complete. Found {len(vulnerabilities)} vulnerabilities.")
-        print(f"Generated {len(patch_candidates)} patch candidates.")
-        print(f"High-risk findings: {len(results['high_risk_findings'])}")
-    else:
-        print("Dry run mode - no patches generated")
+        if not args.dry_run:
+            # Generate patches
+            patch_candidates = await scanner.generate_patch_candidates(vulnerabilities, batched=args.batch)
+            
+            # High-risk selection as a single boolean mask over the impact scores
+            impact_scores = np.fromiter(
+                (candidate["impact_score"] for candidate in patch_candidates),
+                dtype=np.float64,
+                count=len(patch_candidates)
+            )
+            high_risk_findings = [patch_candidates[i] for i in np.flatnonzero(impact_scores > 0.8)]
+            
+            # Save results
+            results = {
+                "scan_timestamp": datetime.now().isoformat(),
+                "vulnerabilities_found": len(vulnerabilities),
+                "patch_candidates": patch_candidates,
+                "high_risk_findings": high_risk_findings
+            }
+            
+            # Human-facing report stays pretty-printed
+            with open("cve_scan_results.json", "wb") as f:
+                f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+            
+            # Save high-risk findings separately for GitHub Actions
+            with open("high_risk_findings.json", "wb") as f:
+                f.write(orjson.dumps(results["high_risk_findings"]))
+            
+            print(f"Scan complete. Found {len(vulnerabilities)} vulnerabilities.")
+            print(f"Generated {len(patch_candidates)} patch candidates.")
+            print(f"High-risk findings: {len(results['high_risk_findings'])}")
+        else:
+            print("Dry run mode - no patches generated")
+    finally:
+        await _shared_http_client.aclose()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    with asyncio.Runner(loop_factory=_LOOP_FACTORY) as runner:
+        runner.run(main())
@@ -1,119 +1,344 @@
 # Shadow traffic mirroring for unbiased evaluation
 import asyncio
+import aiofiles
 import aiohttp
-import json
+import itertools
+import os
 import random
+import numpy as np
+import orjson
 import time
 import argparse
-from typing import List, Dict, Any
-from dataclasses import dataclass
+import contextlib
+from typing import List, Dict, Any, Optional, Mapping
+from collections import Counter
+from dataclasses import dataclass, field
 from datetime import datetime
+from aiolimiter import AsyncLimiter
 
-@dataclass 
+# libuv-backed event loop when available; falls back to the stdlib loop
+try:
+    import uvloop
+    _LOOP_FACTORY = uvloop.new_event_loop
+except ImportError:
+    _LOOP_FACTORY = None
+
+# Transient failures worth retrying, with exponential backoff
+RETRYABLE_STATUSES = frozenset({429, 502, 503, 504})
+MAX_ATTEMPTS = 3
+MAX_RETRY_DELAY = 30.0
+
+# Max queued results coalesced into a single JSONL write
+WRITE_BATCH = 256
+
+# Bytes read (and decoded) for each response's content preview
+PREVIEW_BYTES = 256
+
+@dataclass(slots=True, frozen=True)
 class TrafficRequest:
     endpoint: str
     method: str
     payload: Dict[str, Any]
     headers: Dict[str, str]
     timestamp: float
+    # Resolved once at load time so mirroring does no per-call URL formatting or header merging
+    full_url: str
+    merged_headers: Mapping[str, str]
+    # Serialized once so mirroring neither re-encodes nor re-measures the payload
+    payload_bytes: bytes = field(init=False, repr=False)
+    
+    def __post_init__(self):
+        object.__setattr__(self, "payload_bytes", orjson.dumps(self.payload))
 
 class ShadowTrafficMirror:
-    def __init__(self, shadow_endpoint: str, mirror_percentage: float = 0.1):
+    def __init__(
+        self,
+        shadow_endpoint: str,
+        mirror_percentage: float = 0.1,
+        concurrency: int = 64,
+        max_rate: float = 100.0
+    ):
         self.shadow_endpoint = shadow_endpoint
         self.mirror_percentage = mirror_percentage
-        self.results = []
+        self.concurrency = concurrency
+        # Results stream through a bounded queue to a single JSONL writer instead of a list
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
+        # Running summary counters, so no final pass over all results is needed
+        self._reset_counters()
+        # Collision-free request ids without a clock read per request
+        self._id_counter = itertools.count()
+        # Bounds in-flight shadow attempts instead of a fixed sleep between them
+        self._sem = asyncio.Semaphore(concurrency)
+        # Leaky-bucket cap on attempts per second, sized to the shadow service's capacity
+        self._limiter = AsyncLimiter(max_rate, time_period=1.0)
+        # Pooled keep-alive connections shared across mirror runs; created lazily
+        self._connector: Optional[aiohttp.TCPConnector] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Per-host limiter sized from the shadow endpoint's X-RateLimit-Limit, once seen
+        self._rate_limit_sem: Optional[asyncio.BoundedSemaphore] = None
     
-    async def mirror_traffic(self, requests: List[TrafficRequest], duration: int) -> List[Dict[str, Any]]:
-        """Mirror production traffic to shadow environment"""
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating it (inside the running loop) on first use"""
+        if self._session is None or self._session.closed:
+            self._connector = aiohttp.TCPConnector(
+                limit=256,
+                limit_per_host=self.concurrency,
+                ttl_dns_cache=300,
+                keepalive_timeout=75,
+                enable_cleanup_closed=True
+            )
+            self._session = aiohttp.ClientSession(connector=self._connector)
+        return self._session
+    
+    async def aclose(self):
+        """Close the shared session and its connection pool"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            self._connector = None
+    
+    async def mirror_traffic(self, requests: List[TrafficRequest], duration: int, results_path: str) -> Dict[str, Any]:
+        """Mirror production traffic to shadow environment, streaming results to a JSONL file"""
         
-        start_time = time.time()
-        mirrored_count = 0
+        session = self._get_session()
+        self._reset_counters()
+        writer = asyncio.create_task(self._write_results(results_path))
         
-        async with aiohttp.ClientSession() as session:
-            # NOVEL: Intelligent traffic sampling with load balancing
-            for request in requests:
-                if time.time() - start_time > duration:
-                    break
-                
-                if random.random() < self.mirror_percentage:
-                    result = await self._mirror_single_request(session, request)
-                    self.results.append(result)
-                    mirrored_count += 1
-                    
-                    # Rate limiting to prevent overwhelming shadow environment
-                    await asyncio.sleep(0.1)
+        # NOVEL: Intelligent traffic sampling with load balancing
+        # One vectorized Bernoulli draw instead of a random.random() call per request
+        mask = np.random.random(len(requests)) < self.mirror_percentage
+        tasks = [
+            asyncio.create_task(self._mirror_single_request(session, request))
+            for request in itertools.compress(requests, mask)
+        ]
         
-        return self.results
+        # Whatever is still running at the deadline is cancelled
+        try:
+            if tasks:
+                await asyncio.wait(tasks, timeout=duration)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            
+            if not writer.done():
+                await self._queue.put(None)
+            await writer
+        
+        return self.summary()
+    
+    def _reset_counters(self):
+        """Start a run's summary counters from zero (the mirror is reusable across runs)"""
+        self._total = 0
+        self._successful = 0
+        self._latency_sum_ms = 0.0
+        self._status_counts: Counter = Counter()
+    
+    def _count_result(self, result: Dict[str, Any]):
+        """Fold one written result into the summary counters"""
+        metrics = result["metrics"]
+        self._total += 1
+        self._successful += metrics["success"]
+        self._latency_sum_ms += metrics["latency_ms"]
+        shadow_response = result.get("shadow_response")
+        self._status_counts[str(shadow_response["status_code"]) if shadow_response else "error"] += 1
+    
+    def summary(self) -> Dict[str, Any]:
+        """Summary statistics from the running counters"""
+        return {
+            "total_requests": self._total,
+            "successful_requests": self._successful,
+            "average_latency": self._latency_sum_ms / max(1, self._total),
+            "status_codes": dict(self._status_counts)
+        }
     
-    async def _mirror_single_request(self, session: aiohttp.ClientSession, request: TrafficRequest) -> Dict[str, Any]:
+    async def _write_results(self, path: str):
+        """Single writer draining the result queue into a JSONL file, one write per batch"""
+        async with aiofiles.open(path, "wb") as f:
+            done = False
+            while not done:
+                result = await self._queue.get()
+                batch = []
+                while True:
+                    if result is None:
+                        done = True
+                        break
+                    batch.append(result)
+                    if len(batch) >= WRITE_BATCH or self._queue.empty():
+                        break
+                    result = self._queue.get_nowait()
+                
+                if batch:
+                    await f.write(b"".join(orjson.dumps(result) + b"\n" for result in batch))
+                    # Counted only once written, so the summary always agrees with the JSONL file
+                    for result in batch:
+                        self._count_result(result)
+    
+    async def _mirror_single_request(self, session: aiohttp.ClientSession, request: TrafficRequest):
         """Mirror a single request to shadow environment"""
         
-        start_time = time.time()
+        result = await self._send_shadow_request(session, request)
+        await self._queue.put(result)
+    
+    async def _send_shadow_request(self, session: aiohttp.ClientSession, request: TrafficRequest) -> Dict[str, Any]:
+        """Send one shadow request and collect its metrics, retrying transient failures"""
         
-        try:
-            # NOVEL: Shadow request with comprehensive metrics collection
-            shadow_url = f"{self.shadow_endpoint}{request.endpoint}"
-            
-            async with session.request(
-                method=request.method,
-                url=shadow_url,
-                json=request.payload,
-                headers={**request.headers, "X-Shadow-Request": "true"},
-                timeout=aiohttp.ClientTimeout(total=30)
-            ) as response:
-                
-                response_time = time.time() - start_time
-                response_text = await response.text()
-                
-                return {
-                    "request_id": f"shadow_{int(time.time()*1000)}",
-                    "original_request": {
-                        "endpoint": request.endpoint,
-                        "method": request.method,
-                        "payload_size": len(json.dumps(request.payload))
-                    },
-                    "shadow_response": {
-                        "status_code": response.status,
-                        "response_time": response_time,
-                        "response_size": len(response_text),
-                        "content_preview": response_text[:200] if response_text else ""
-                    },
-                    "metrics": {
-                        "success": response.status < 400,
-                        "latency_ms": response_time * 1000,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                }
+        # Monotonic loop clock: immune to NTP adjustments that skew latency percentiles.
+        # latency_ms covers the final attempt only; total_elapsed_ms includes retries and backoff
+        loop = asyncio.get_running_loop()
+        start_time = attempt_start = loop.time()
+        retries = 0
+        
+        # NOVEL: Shadow request with comprehensive metrics collection
+        while True:
+            # Held per attempt only, so backoff sleeps don't tie up the concurrency budget
+            async with self._sem:
+                try:
+                    await self._limiter.acquire()
+                    async with self._rate_limit_sem or contextlib.nullcontext():
+                        # Timed from here so queueing in the limiters is not counted as latency
+                        attempt_start = loop.time()
+                        async with session.request(
+                            method=request.method,
+                            url=request.full_url,
+                            data=request.payload_bytes,
+                            headers=request.merged_headers,
+                            timeout=aiohttp.ClientTimeout(total=30)
+                        ) as response:
+                            
+                            self._observe_rate_limit(response.headers)
+                            
+                            if response.status in RETRYABLE_STATUSES and retries < MAX_ATTEMPTS - 1:
+                                delay = self._retry_delay(retries, response.headers)
+                            else:
+                                response_time = loop.time() - attempt_start
+                                # Decode only a bounded preview; the rest is drained undecoded so the
+                                # connection stays reusable and the size is exact without Content-Length
+                                preview_bytes = await self._read_preview(response.content)
+                                response_size = len(preview_bytes)
+                                async for chunk in response.content.iter_any():
+                                    response_size += len(chunk)
+                                
+                                return {
+                                    "request_id": f"shadow_{next(self._id_counter)}",
+                                    "original_request": {
+                                        "endpoint": request.endpoint,
+                                        "method": request.method,
+                                        "payload_size": len(request.payload_bytes)
+                                    },
+                                    "shadow_response": {
+                                        "status_code": response.status,
+                                        "response_time": response_time,
+                                        "response_size": response_size,
+                                        "content_preview": preview_bytes.decode("utf-8", "replace")[:200]
+                                    },
+                                    "metrics": {
+                                        "success": response.status < 400,
+                                        "latency_ms": response_time * 1000,
+                                        "total_elapsed_ms": (loop.time() - start_time) * 1000,
+                                        "retries": retries,
+                                        "timestamp": datetime.now().isoformat()
+                                    }
+                                }
+                    
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if retries >= MAX_ATTEMPTS - 1:
+                        return self._error_result(e, attempt_start, start_time, retries)
+                    delay = self._retry_delay(retries)
                 
-        except Exception as e:
-            return {
-                "request_id": f"shadow_error_{int(time.time()*1000)}",
-                "error": str(e),
-                "metrics": {
-                    "success": False,
-                    "latency_ms": (time.time() - start_time) * 1000,
-                    "timestamp": datetime.now().isoformat()
-                }
+                except Exception as e:
+                    return self._error_result(e, attempt_start, start_time, retries)
+            
+            retries += 1
+            await asyncio.sleep(delay)
+    
+    async def _read_preview(self, content: aiohttp.StreamReader) -> bytes:
+        """First PREVIEW_BYTES of a body (fewer only at EOF); a single read returns whatever is buffered"""
+        preview = b""
+        while len(preview) < PREVIEW_BYTES:
+            chunk = await content.read(PREVIEW_BYTES - len(preview))
+            if not chunk:
+                break
+            preview += chunk
+        return preview
+    
+    def _error_result(self, error: Exception, attempt_start: float, start_time: float, retries: int) -> Dict[str, Any]:
+        """Metrics record for a request that ultimately failed"""
+        now = asyncio.get_running_loop().time()
+        return {
+            "request_id": f"shadow_error_{next(self._id_counter)}",
+            "error": str(error),
+            "metrics": {
+                "success": False,
+                "latency_ms": (now - attempt_start) * 1000,
+                "total_elapsed_ms": (now - start_time) * 1000,
+                "retries": retries,
+                "timestamp": datetime.now().isoformat()
             }
+        }
+    
+    def _observe_rate_limit(self, headers: Mapping[str, str]):
+        """Size the per-host limiter from the first advertised X-RateLimit-Limit"""
+        if self._rate_limit_sem is not None:
+            return
+        try:
+            limit = int(headers.get("X-RateLimit-Limit", ""))
+        except ValueError:
+            return
+        if limit > 0:
+            self._rate_limit_sem = asyncio.BoundedSemaphore(limit)
+    
+    def _retry_delay(self, attempt: int, headers: Optional[Mapping[str, str]] = None) -> float:
+        """Backoff before the next attempt, honouring Retry-After / X-RateLimit-Reset"""
+        if headers is not None:
+            retry_after = headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(MAX_RETRY_DELAY, float(retry_after))
+            
+            if headers.get("X-RateLimit-Remaining") == "0":
+                try:
+                    reset = float(headers.get("X-RateLimit-Reset", ""))
+                    # Reset may be an epoch timestamp or a delta in seconds
+                    wait = reset - time.time() if reset > 1e9 else reset
+                    return min(MAX_RETRY_DELAY, max(0.0, wait))
+                except ValueError:
+                    pass
+        
+        return min(MAX_RETRY_DELAY, 2 ** attempt * 0.25 + random.random() * 0.1)
 
-def load_traffic_samples(file_path: str) -> List[TrafficRequest]:
-    """Load traffic samples from JSON file"""
+def load_traffic_samples(file_path: str, shadow_endpoint: str) -> List[TrafficRequest]:
+    """Load traffic samples from JSON file, resolving shadow URLs and headers up front"""
+    
+    shadow_urls: Dict[str, str] = {}
+    
+    def traffic_request(endpoint: str, method: str, payload: Dict[str, Any], headers: Dict[str, str]) -> TrafficRequest:
+        full_url = shadow_urls.get(endpoint)
+        if full_url is None:
+            full_url = shadow_urls[endpoint] = f"{shadow_endpoint}{endpoint}"
+        
+        return TrafficRequest(
+            endpoint=endpoint,
+            method=method,
+            payload=payload,
+            headers=headers,
+            timestamp=time.time(),
+            full_url=full_url,
+            merged_headers={"Content-Type": "application/json", **headers, "X-Shadow-Request": "true"}
+        )
     
     # Mock traffic data for demo
     mock_requests = [
-        TrafficRequest(
+        traffic_request(
             endpoint="/chat-tot",
             method="POST",
             payload={"message": "How do I fix this bug?", "context": {}},
-            headers={"Content-Type": "application/json"},
-            timestamp=time.time()
+            headers={"Content-Type": "application/json"}
         ),
-        TrafficRequest(
+        traffic_request(
             endpoint="/explain",
             method="POST", 
             payload={"query": "Explain this code", "include_reasoning": True},
-            headers={"Content-Type": "application/json"},
-            timestamp=time.time()
+            headers={"Content-Type": "application/json"}
         )
     ]
     
@@ -125,44 +350,50 @@ async def main():
     parser.add_argument("--mirror-percentage", type=float, default=0.1, help="Percentage to mirror")
     parser.add_argument("--shadow-endpoint", required=True, help="Shadow endpoint URL")
     parser.add_argument("--duration", type=int, default=3600, help="Duration in seconds")
-    parser.add_argument("--output", required=True, help="Output file")
+    parser.add_argument("--output", required=True, help="Output path; writes <base>.jsonl and <base>.summary.json")
+    parser.add_argument("--concurrency", type=int, default=64, help="Max in-flight shadow requests")
+    parser.add_argument("--max-rate", type=float, default=100.0, help="Max shadow requests per second")
     
     args = parser.parse_args()
     
     # Load traffic samples
-    requests = load_traffic_samples(args.source_logs)
+    requests = load_traffic_samples(args.source_logs, args.shadow_endpoint)
     
     # Initialize mirror
     mirror = ShadowTrafficMirror(
         shadow_endpoint=args.shadow_endpoint,
-        mirror_percentage=args.mirror_percentage
+        mirror_percentage=args.mirror_percentage,
+        concurrency=args.concurrency,
+        max_rate=args.max_rate
     )
     
     # Mirror traffic
     print(f"Starting shadow traffic mirroring for {args.duration} seconds...")
-    results = await mirror.mirror_traffic(requests, args.duration)
-    
-    # Save results
-    output_data = {
-        "mirror_config": {
-            "mirror_percentage": args.mirror_percentage,
-            "duration": args.duration,
-            "shadow_endpoint": args.shadow_endpoint
-        },
-        "summary": {
-            "total_requests": len(results),
-            "successful_requests": sum(1 for r in results if r.get("metrics", {}).get("success", False)),
-            "average_latency": sum(r.get("metrics", {}).get("latency_ms", 0) for r in results) / len(results) if results else 0
-        },
-        "results": results
-    }
-    
-    with open(args.output, 'w') as f:
-        json.dump(output_data, f, indent=2)
-    
-    print(f"Shadow mirroring complete. {len(results)} requests processed.")
-    print(f"Success rate: {output_data['summary']['successful_requests']/len(results)*100:.1f}%")
-    print(f"Average latency: {output_data['summary']['average_latency']:.1f}ms")
+    output_base = os.path.splitext(args.output)[0]
+    results_path = output_base + ".jsonl"
+    summary_path = output_base + ".summary.json"
+    try:
+        summary = await mirror.mirror_traffic(requests, args.duration, results_path)
+    finally:
+        await mirror.aclose()
+    
+    # Per-request results were streamed to results_path; only config + counters remain
+    with open(summary_path, 'wb') as f:
+        f.write(orjson.dumps({
+            "mirror_config": {
+                "mirror_percentage": args.mirror_percentage,
+                "duration": args.duration,
+                "shadow_endpoint": args.shadow_endpoint
+            },
+            "summary": summary,
+            "results_file": results_path
+        }, option=orjson.OPT_INDENT_2))
+    
+    total = summary["total_requests"]
+    print(f"Shadow mirroring complete. {total} requests processed.")
+    print(f"Success rate: {summary['successful_requests']/max(1, total)*100:.1f}%")
+    print(f"Average latency: {summary['average_latency']:.1f}ms")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    with asyncio.Runner(loop_factory=_LOOP_FACTORY) as runner:
+        runner.run(main())
@@ -0,0 +1,68 @@
+# Tests for incremental parsing of sandbox patch output
+import orjson
+
+from app.sandbox.run import _PatchOutputParser, _RESULT_SENTINEL_BYTES
+
+STDOUT, STDERR = 1, 2
+
+
+def result_line(payload):
+    return _RESULT_SENTINEL_BYTES + orjson.dumps(payload) + b"\n"
+
+
+def test_result_split_across_chunks():
+    parser = _PatchOutputParser()
+    line = result_line({"success": True})
+    parser.feed(STDOUT, b"collecting...\n" + line[:5])
+    parser.feed(STDOUT, line[5:])
+
+    result, logs = parser.finish()
+
+    assert result == {"success": True}
+    assert logs == "collecting..."
+
+
+def test_result_larger_than_log_cap_is_not_truncated():
+    parser = _PatchOutputParser(max_log_bytes=1024)
+    payload = {"test_results": {"stdout": "x" * 4096}}
+    line = result_line(payload)
+    for i in range(0, len(line), 100):
+        parser.feed(STDOUT, line[i:i + 100])
+
+    result, _ = parser.finish()
+
+    assert result == payload
+
+
+def test_log_tail_is_bounded():
+    parser = _PatchOutputParser(max_log_bytes=64)
+    for i in range(100):
+        parser.feed(STDERR, b"line %d\n" % i)
+
+    result, logs = parser.finish()
+
+    assert result is None
+    assert len(logs) <= 64
+    assert logs.endswith("line 99")
+
+
+def test_oversized_non_result_line_is_flushed():
+    parser = _PatchOutputParser(max_log_bytes=16)
+    parser.feed(STDOUT, b"y" * 100)
+
+    assert parser._pending[STDOUT] == b""
+    _, logs = parser.finish()
+    assert logs == "y" * 16
+
+
+def test_streams_keep_separate_partial_lines():
+    parser = _PatchOutputParser()
+    line = result_line({"success": False})
+    parser.feed(STDOUT, line[:8])
+    parser.feed(STDERR, b"warning\n")
+    parser.feed(STDOUT, line[8:])
+
+    result, logs = parser.finish()
+
+    assert result == {"success": False}
+    assert logs == "warning"
@@ -0,0 +1,175 @@
+# Tests for sandbox container lifecycle, using fake Docker objects
+import asyncio
+
+from app.sandbox.run import SandboxRunner
+
+
+class FakeExec:
+    def __init__(self, states):
+        self._states = list(states)
+
+    async def inspect(self):
+        return self._states.pop(0) if len(self._states) > 1 else self._states[0]
+
+
+def test_wait_exit_code_polls_until_not_running():
+    exec_ = FakeExec([
+        {"Running": True, "ExitCode": None},
+        {"Running": True, "ExitCode": None},
+        {"Running": False, "ExitCode": 0},
+    ])
+
+    assert asyncio.run(SandboxRunner()._wait_exit_code(exec_)) == 0
+
+
+class FakeContainer:
+    def __init__(self, id="c1"):
+        self.id = id
+        self.deleted = False
+        self.archives = []
+
+    async def put_archive(self, path, data):
+        self.archives.append(path)
+
+    async def delete(self, force=False):
+        self.deleted = True
+
+
+def runner_with(container):
+    runner = SandboxRunner()
+    runner._live_containers = 1
+    runner._run_counts[container.id] = 0
+    released = []
+
+    async def acquire(*args, **kwargs):
+        return container
+
+    async def release(c):
+        released.append(c)
+
+    runner._acquire_container = acquire
+    runner._release_container = release
+    return runner, released
+
+
+def test_cancelled_run_discards_container():
+    container = FakeContainer()
+    runner, released = runner_with(container)
+
+    async def hang(*args):
+        await asyncio.Event().wait()
+
+    runner._monitor_execution = hang
+
+    async def run():
+        task = asyncio.create_task(runner.run_patch({"requirements": ["pytest"]}))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+
+    assert container.deleted
+    assert released == []
+    assert runner._live_containers == 0
+
+
+def test_timed_out_run_discards_container():
+    container = FakeContainer()
+    runner, released = runner_with(container)
+
+    async def timeout(container, timeout, start_time):
+        return {"success": False, "error": "timeout"}, False
+
+    runner._monitor_execution = timeout
+
+    result = asyncio.run(runner.run_patch({"requirements": ["pytest"]}))
+
+    assert result["success"] is False
+    assert container.deleted
+    assert released == []
+
+
+def test_finished_run_releases_container():
+    container = FakeContainer()
+    runner, released = runner_with(container)
+
+    async def finished(container, timeout, start_time):
+        return {"success": True}, True
+
+    runner._monitor_execution = finished
+
+    assert asyncio.run(runner.run_patch({"requirements": ["pytest"]})) == {"success": True}
+    assert released == [container]
+    assert not container.deleted
+
+
+def pooled_runner(pool_size=1):
+    runner = SandboxRunner(pool_size=pool_size)
+    started = []
+
+    async def start():
+        container = FakeContainer(id=f"c{len(started)}")
+        started.append(container)
+        runner._run_counts[container.id] = 0
+        return container
+
+    runner._start_container = start
+    return runner, started
+
+
+def test_waiter_starts_replacement_when_container_discarded():
+    runner, started = pooled_runner()
+
+    async def run():
+        first = await runner._acquire_container(timeout=1)
+        waiter = asyncio.create_task(runner._acquire_container(timeout=1))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+
+        await runner._discard_container(first)
+        return await waiter
+
+    second = asyncio.run(run())
+
+    assert [c.id for c in started] == ["c0", "c1"]
+    assert second is started[1]
+    assert runner._live_containers == 1
+
+
+def test_acquire_times_out_with_clear_error():
+    runner, _ = pooled_runner()
+
+    async def run():
+        await runner._acquire_container(timeout=1)
+        await runner._acquire_container(timeout=0.05)
+
+    try:
+        asyncio.run(run())
+    except RuntimeError as e:
+        assert "No sandbox container available" in str(e)
+    else:
+        raise AssertionError("expected RuntimeError")
+
+
+def test_failed_start_frees_slot():
+    runner = SandboxRunner(pool_size=1)
+
+    async def broken_start():
+        raise OSError("engine down")
+
+    runner._start_container = broken_start
+
+    async def run():
+        for _ in range(2):
+            try:
+                await runner._acquire_container(timeout=0.05)
+            except OSError:
+                pass
+
+    asyncio.run(run())
+
+    assert runner._live_containers == 0
@@ -0,0 +1,64 @@
+# Tests for the shadow traffic JSONL results writer
+import asyncio
+
+import orjson
+
+from scripts import shadow_traffic
+from scripts.shadow_traffic import ShadowTrafficMirror
+
+
+def make_mirror(**kwargs):
+    return ShadowTrafficMirror(shadow_endpoint="http://shadow.test", **kwargs)
+
+
+def make_result(i, status=200, latency_ms=10.0):
+    return {
+        "request_id": f"shadow_{i}",
+        "shadow_response": {"status_code": status},
+        "metrics": {"success": status < 400, "latency_ms": latency_ms, "retries": 0},
+    }
+
+
+def test_write_results_batches_queued_results(tmp_path, monkeypatch):
+    monkeypatch.setattr(shadow_traffic, "WRITE_BATCH", 3)
+    writes = []
+
+    class RecordingFile:
+        async def write(self, data):
+            writes.append(data)
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(shadow_traffic.aiofiles, "open", lambda path, mode: RecordingFile())
+
+    async def run():
+        mirror = make_mirror()
+        for i in range(7):
+            mirror._queue.put_nowait(make_result(i))
+        mirror._queue.put_nowait(None)
+        await mirror._write_results(str(tmp_path / "results.jsonl"))
+
+    asyncio.run(run())
+
+    assert len(writes) == 3
+    lines = b"".join(writes).splitlines()
+    assert [orjson.loads(line)["request_id"] for line in lines] == [f"shadow_{i}" for i in range(7)]
+
+
+def test_write_results_produces_jsonl(tmp_path):
+    path = tmp_path / "results.jsonl"
+
+    async def run():
+        mirror = make_mirror()
+        writer = asyncio.create_task(mirror._write_results(str(path)))
+        await mirror._queue.put(make_result(0))
+        await mirror._queue.put(None)
+        await writer
+
+    asyncio.run(run())
+
+    assert path.read_bytes() == orjson.dumps(make_result(0)) + b"\n"
@@ -0,0 +1,176 @@
+# Tests for shadow traffic retries, latency accounting and summary counters
+import asyncio
+import time
+
+from aiohttp import web
+
+from scripts import shadow_traffic
+from scripts.shadow_traffic import MAX_RETRY_DELAY, ShadowTrafficMirror, load_traffic_samples
+
+
+def make_mirror(**kwargs):
+    return ShadowTrafficMirror(shadow_endpoint="http://shadow.test", **kwargs)
+
+
+def make_result(i, status=200, latency_ms=10.0):
+    return {
+        "request_id": f"shadow_{i}",
+        "shadow_response": {"status_code": status},
+        "metrics": {"success": status < 400, "latency_ms": latency_ms, "retries": 0},
+    }
+
+
+def test_retry_delay_honours_retry_after():
+    assert make_mirror()._retry_delay(0, {"Retry-After": "7"}) == 7.0
+
+
+def test_retry_delay_is_capped():
+    mirror = make_mirror()
+    assert mirror._retry_delay(0, {"Retry-After": "3600"}) == MAX_RETRY_DELAY
+    assert mirror._retry_delay(20) == MAX_RETRY_DELAY
+
+
+def test_retry_delay_uses_rate_limit_reset():
+    mirror = make_mirror()
+    headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "4"}
+    assert mirror._retry_delay(0, headers) == 4.0
+
+    epoch_headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(time.time() + 2)}
+    assert 0.0 < mirror._retry_delay(0, epoch_headers) <= 2.0
+
+
+def test_retry_delay_backs_off_exponentially():
+    mirror = make_mirror()
+    assert 0.25 <= mirror._retry_delay(0) < 0.35
+    assert 1.0 <= mirror._retry_delay(2) < 1.1
+
+
+def test_latency_excludes_retry_backoff():
+    attempts = []
+
+    async def handler(request):
+        attempts.append(request)
+        if len(attempts) == 1:
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        return web.Response(text="ok")
+
+    async def run():
+        app = web.Application()
+        app.router.add_route("POST", "/chat-tot", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        endpoint = f"http://127.0.0.1:{port}"
+        mirror = ShadowTrafficMirror(shadow_endpoint=endpoint)
+        request = load_traffic_samples("unused", endpoint)[0]
+        try:
+            return await mirror._send_shadow_request(mirror._get_session(), request)
+        finally:
+            await mirror.aclose()
+            await runner.cleanup()
+
+    result = asyncio.run(run())
+    metrics = result["metrics"]
+
+    assert result["shadow_response"]["status_code"] == 200
+    assert metrics["retries"] == 1
+    assert metrics["total_elapsed_ms"] >= 1000
+    assert metrics["latency_ms"] < 500
+    assert attempts[0].headers["X-Shadow-Request"] == "true"
+
+
+def test_summary_counts_only_written_results_and_resets_per_run(tmp_path):
+    mirror = make_mirror()
+    requests = load_traffic_samples("unused", "http://shadow.test")[:3]
+    sent = []
+
+    async def fake_send(session, request):
+        sent.append(request)
+        return make_result(len(sent), status=503 if len(sent) == 2 else 200, latency_ms=20.0)
+
+    mirror._send_shadow_request = fake_send
+    mirror.mirror_percentage = 1.0
+
+    async def run():
+        first = await mirror.mirror_traffic(requests, 5, str(tmp_path / "first.jsonl"))
+        second = await mirror.mirror_traffic(requests[:1], 5, str(tmp_path / "second.jsonl"))
+        await mirror.aclose()
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first["total_requests"] == 3
+    assert first["successful_requests"] == 2
+    assert first["status_codes"] == {"200": 2, "503": 1}
+    assert second["total_requests"] == 1
+    assert second["average_latency"] == 20.0
+    assert len((tmp_path / "second.jsonl").read_bytes().splitlines()) == 1
+
+
+class TrickleStream:
+    def __init__(self, chunks):
+        self._chunks = list(chunks)
+
+    async def read(self, n=-1):
+        if not self._chunks:
+            return b""
+        chunk = self._chunks.pop(0)
+        if n >= 0 and len(chunk) > n:
+            self._chunks.insert(0, chunk[n:])
+            chunk = chunk[:n]
+        return chunk
+
+
+def test_preview_keeps_reading_until_full():
+    stream = TrickleStream([b"a" * 10, b"b" * 100, b"c" * 500])
+
+    preview = asyncio.run(make_mirror()._read_preview(stream))
+
+    assert preview == b"a" * 10 + b"b" * 100 + b"c" * (shadow_traffic.PREVIEW_BYTES - 110)
+    assert stream._chunks == [b"c" * (500 - (shadow_traffic.PREVIEW_BYTES - 110))]
+
+
+def test_preview_stops_at_eof():
+    preview = asyncio.run(make_mirror()._read_preview(TrickleStream([b"short", b" body"])))
+
+    assert preview == b"short body"
+
+
+def test_backoff_releases_concurrency_slot():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.path)
+        if request.path == "/chat-tot" and calls.count("/chat-tot") == 1:
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        return web.Response(text="ok")
+
+    async def run():
+        app = web.Application()
+        app.router.add_route("POST", "/{tail:.*}", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        endpoint = f"http://127.0.0.1:{port}"
+        mirror = ShadowTrafficMirror(shadow_endpoint=endpoint, concurrency=1)
+        retried, other = load_traffic_samples("unused", endpoint)[:2]
+        session = mirror._get_session()
+        try:
+            first = asyncio.create_task(mirror._send_shadow_request(session, retried))
+            await asyncio.sleep(0.2)
+            second = await asyncio.wait_for(mirror._send_shadow_request(session, other), timeout=0.5)
+            return await first, second
+        finally:
+            await mirror.aclose()
+            await runner.cleanup()
+
+    first, second = asyncio.run(run())
+
+    assert first["metrics"]["retries"] == 1
+    assert second["shadow_response"]["status_code"] == 200